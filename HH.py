@@ -18,7 +18,9 @@ WRAPPER_VERSION = "1.0"
 import ctypes as ct
 from ctypes import byref
 import time
+import numpy as np
 from engineering_notation import EngNumber
+from histogram import SparseHistogram
 
 # Variables to store information read from DLLs
 counts = [(ct.c_uint * MAXHISTLEN)() for i in range(0, HHMAXINPCHAN)]
@@ -253,14 +255,16 @@ def getResolution():
     return int(resolution.value)
 
 
-def measureAllInputs(tacq):
+def measureAllInputs(tacq, sparse=False):
     """Measurement in histogram mode
 
     Args:
         tacq (int): acquisition time [ms]
+        sparse (bool, optional): return list of SparseHistogram instead of counts. Defaults to False.
 
     Returns:
-        data (tuple): outputMessage, length of histogram, number of channels and 2d array of counts
+        data (tuple): outputMessage, length of histogram, number of channels and 2d array of counts,
+            or list of SparseHistogram of every channel if sparse
     """
 
     out = "AcquisitionTime   : " + str(tacq) + "\n"
@@ -281,12 +285,26 @@ def measureAllInputs(tacq):
             ),
             "GetHistogram",
         )
-        integralCount = 0
-        for j in range(0, histLen.value):
-            integralCount += counts[i][j]
+        integralCount = int(
+            np.frombuffer(counts[i], dtype=np.uint32, count=histLen.value).sum(
+                dtype=np.uint64
+            )
+        )
         out += "  Integralcount[" + str(i) + "]=" + str(integralCount) + "\n"
     tryfunc(hhlib.HH_GetFlags(ct.c_int(dev[0]), byref(flags)), "GetFlags")
     if flags.value & FLAG_OVERFLOW > 0:
         out += "ERROR:  Overflow."
 
+    if sparse:
+        return (
+            out,
+            histLen.value,
+            numChannels.value,
+            [
+                SparseHistogram.fromDense(
+                    np.frombuffer(counts[i], dtype=np.uint32, count=histLen.value)
+                )
+                for i in range(0, numChannels.value)
+            ],
+        )
     return (out, histLen.value, numChannels.value, counts)
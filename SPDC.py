@@ -0,0 +1,307 @@
+# Expected SPDC rates in BBO and fits of the model to measured scans
+# All functions broadcast over numpy arrays of their arguments (except wavelength)
+
+import numpy as np
+from scipy.constants import c, epsilon_0, h
+
+import BBO
+
+
+def _deriv(f, x0, step=1e-6):
+    return (f(x0 + step) - f(x0 - step)) / (2 * step)
+
+
+def groupMismatch(l, angle, model: BBO.Models = "Eimerl"):
+    """Get D from efficiency.ipynb, group index mismatch of extraordinary pump
+    and ordinary degenerate signal and idler
+
+    Args:
+        l (float): pump wavelength in um
+        angle (array): angle between crystal axis and pump [rad]
+        model (Models, optional): dispertion model. Defaults to "Eimerl".
+
+    Returns:
+        array: |D|
+    """
+
+    def nl(x):
+        return BBO.neeff(x, angle, model)
+
+    def no(x):
+        return BBO.no(x, model)
+
+    return np.abs(
+        BBO.no(2 * l, model) - nl(l) + l * _deriv(nl, l) - 2 * l * _deriv(no, 2 * l)
+    )
+
+
+def pumpPhotonRate(power, l=0.370):
+    """Get number of pump photons per second
+
+    Args:
+        power (array): pump power [W]
+        l (float, optional): pump wavelength in um. Defaults to 0.370.
+
+    Returns:
+        array: [1/s]
+    """
+    return power / (h * c / (l * 1e-6))
+
+
+def phaseMismatch(angle, l=0.370, opening=0, model: BBO.Models = "Eimerl"):
+    """Get Delta k = k_p - k_s - k_i of SPDC I (e -> o + o) with degenerate signal and idler
+    leaving at opening angle to pump inside the crystal
+
+    Args:
+        angle (array): angle between crystal axis and pump [rad]
+        l (float, optional): pump wavelength in um. Defaults to 0.370.
+        opening (array, optional): angle between pump and signal inside crystal [rad]. Defaults to 0.
+        model (Models, optional): dispertion model. Defaults to "Eimerl".
+
+    Returns:
+        array: Delta k [1/m]
+    """
+    return (
+        2
+        * np.pi
+        / (l * 1e-6)
+        * (BBO.neeff(l, angle, model) - BBO.no(2 * l, model) * np.cos(opening))
+    )
+
+
+def phaseMatchingAngle(l=0.370, opening=0, model: BBO.Models = "Eimerl"):
+    """Get angle between crystal axis and pump where Delta k = 0
+
+    Args:
+        l (float, optional): pump wavelength in um. Defaults to 0.370.
+        opening (array, optional): angle between pump and signal inside crystal [rad]. Defaults to 0.
+        model (Models, optional): dispertion model. Defaults to "Eimerl".
+
+    Returns:
+        array: [rad]
+    """
+    n = BBO.no(2 * l, model) * np.cos(opening)
+    no, ne = BBO.no(l, model), BBO.ne(l, model)
+    return np.arcsin(np.sqrt((n**-2 - no**-2) / (ne**-2 - no**-2)))
+
+
+def phaseMatching(angle, length, l=0.370, opening=0, model: BBO.Models = "Eimerl"):
+    """Get sinc^2(Delta k L / 2), fraction of pairs left by phase mismatch
+
+    Args:
+        angle (array): angle between crystal axis and pump [rad]
+        length (array): crystal length [m]
+        l (float, optional): pump wavelength in um. Defaults to 0.370.
+        opening (array, optional): angle between pump and signal inside crystal [rad]. Defaults to 0.
+        model (Models, optional): dispertion model. Defaults to "Eimerl".
+
+    Returns:
+        array: from 0 to 1
+    """
+    # np.sinc(x) = sin(pi x) / (pi x)
+    return np.sinc(phaseMismatch(angle, l, opening, model) * length / (2 * np.pi)) ** 2
+
+
+def pairRate(
+    deff,
+    power,
+    area,
+    length,
+    angle,
+    l=0.370,
+    model: BBO.Models = "Eimerl",
+    opening=0,
+):
+    """Get rate of generated pairs, efficiency2 from efficiency.ipynb
+    times phase matching sinc^2(Delta k L / 2)
+
+    Args:
+        deff (array): effective nonlinear coefficient [m/V]
+        power (array): pump power [W]
+        area (array): pump beam area [m^2]
+        length (array): crystal length [m]
+        angle (array): angle between crystal axis and pump [rad],
+            e.g. phaseMatchingAngle(l, opening, model)
+        l (float, optional): pump wavelength in um. Defaults to 0.370.
+        model (Models, optional): dispertion model. Defaults to "Eimerl".
+        opening (array, optional): angle between pump and signal inside crystal [rad]. Defaults to 0.
+
+    Returns:
+        array: pairs [1/s]
+    """
+    n1 = BBO.no(2 * l, model)
+    n2 = BBO.neeff(l, angle, model)
+    omega = 2 * np.pi * c / (l * 1e-6)
+    return (
+        1
+        / (2 * c**2 * epsilon_0)
+        * length
+        * deff**2
+        * (power / area)
+        * omega**2
+        / (n1 * n2 * n1)
+        / groupMismatch(l, angle, model)
+        * phaseMatching(angle, length, l, opening, model)
+    )
+
+
+def expectedRates(pairs, efficiency=(1, 1), darkRate=(0, 0), window=0):
+    """Get singles and coincidences of two detectors looking at pairs,
+    same model as TTTR.generateSPDC
+
+    Args:
+        pairs (array): rate of pairs [1/s]
+        efficiency (tuple, optional): probability of detecting photon of pair by each detector,
+            including collection. Defaults to (1, 1).
+        darkRate (tuple, optional): dark counts of each detector [1/s]. Defaults to (0, 0).
+        window (float, optional): coincidence window [s], adds accidental coincidences. Defaults to 0.
+
+    Returns:
+        tuple: singles of both detectors and coincidences [1/s]
+    """
+    singlesA = efficiency[0] * pairs + darkRate[0]
+    singlesB = efficiency[1] * pairs + darkRate[1]
+    coincidences = efficiency[0] * efficiency[1] * pairs + singlesA * singlesB * window
+    return singlesA, singlesB, coincidences
+
+
+def fitPowerScan(power, singlesA, singlesB, coincidences, window=None, offset=False):
+    """Fits lines to singles against pump power and C = k P + window S_A S_B (+ offset)
+    to coincidences, using measured singles for accidentals like expectedRates,
+    pair rate and efficiencies follow from S_A = e_A R, S_B = e_B R and C = e_A e_B R
+
+    Args:
+        power (array): pump power [W]
+        singlesA (array): [1/s]
+        singlesB (array): [1/s]
+        coincidences (array): [1/s]
+        window (float, optional): coincidence window [s]. Defaults to None, fitted.
+        offset (bool, optional): fit also constant term of coincidences. Defaults to False.
+
+    Returns:
+        dict: pairsPerWatt [1/(s W)], efficiency (tuple), darkRate (tuple),
+            window [s], accidentals at every power [1/s],
+            slopes, intercepts of all three lines (intercept of coincidences is the offset)
+    """
+    power = np.asarray(power, dtype=float)
+    singlesA = np.asarray(singlesA, dtype=float)
+    singlesB = np.asarray(singlesB, dtype=float)
+    coincidences = np.asarray(coincidences, dtype=float)
+    product = singlesA * singlesB
+
+    X = np.column_stack((power, np.ones_like(power)))
+    (slopes, intercepts), *_ = np.linalg.lstsq(
+        X, np.column_stack((singlesA, singlesB)), rcond=None
+    )
+
+    columns = [power]
+    if window is None:
+        columns.append(product)
+    else:
+        coincidences = coincidences - window * product
+    if offset:
+        columns.append(np.ones_like(power))
+    params, *_ = np.linalg.lstsq(np.column_stack(columns), coincidences, rcond=None)
+    slopeC = params[0]
+    if window is None:
+        window = params[1]
+    interceptC = params[-1] if offset else 0.0
+
+    slopes = np.append(slopes, slopeC)
+    intercepts = np.append(intercepts, interceptC)
+    return {
+        "pairsPerWatt": slopes[0] * slopes[1] / slopes[2],
+        "efficiency": (slopes[2] / slopes[1], slopes[2] / slopes[0]),
+        "darkRate": (intercepts[0], intercepts[1]),
+        "window": window,
+        "accidentals": window * product,
+        "slopes": slopes,
+        "intercepts": intercepts,
+    }
+
+
+def collectionEfficiency(
+    pairsPerWatt,
+    deff,
+    area,
+    length,
+    angle,
+    l=0.370,
+    model: BBO.Models = "Eimerl",
+    opening=0,
+):
+    """Get fraction of modelled pairs seen in the measurement, e.g. over grid of deff
+
+    Args:
+        pairsPerWatt (array): measured pairs per pump power, from fitPowerScan [1/(s W)]
+        deff (array): effective nonlinear coefficient [m/V]
+        area (array): pump beam area [m^2]
+        length (array): crystal length [m]
+        angle (array): angle between crystal axis and pump [rad]
+        l (float, optional): pump wavelength in um. Defaults to 0.370.
+        model (Models, optional): dispertion model. Defaults to "Eimerl".
+        opening (array, optional): angle between pump and signal inside crystal [rad]. Defaults to 0.
+
+    Returns:
+        array: measured / modelled pairs
+    """
+    return pairsPerWatt / pairRate(deff, 1.0, area, length, angle, l, model, opening)
+
+
+def fitAngleScan(
+    angle,
+    rates,
+    centers,
+    lengths,
+    l=0.370,
+    opening=0,
+    model: BBO.Models = "Eimerl",
+):
+    """Fits a * phaseMatching + b to every rate with common center and crystal length,
+    for every center and length of grid at once (Poisson weighted least squares).
+    Rotation of crystal by angle - center outside is refracted inside it,
+    so the pump is at phaseMatchingAngle + arcsin(sin(angle - center) / n_e) to crystal axis
+
+    Args:
+        angle (array): rotation of crystal of N measurements, e.g. read from its mount [rad]
+        rates (array): N measurements of K rates, shape (N,) or (N, K), e.g. singles and coincidences
+        centers (array): tried rotations where pump is phase matched [rad]
+        lengths (array): tried crystal lengths [m]
+        l (float, optional): pump wavelength in um. Defaults to 0.370.
+        opening (float, optional): angle between pump and signal inside crystal [rad]. Defaults to 0.
+        model (Models, optional): dispertion model. Defaults to "Eimerl".
+
+    Returns:
+        dict: center, length, amplitude (K), background (K) of best fit and chi2 over grid
+    """
+    angle = np.asarray(angle, dtype=float)
+    Y = np.asarray(rates, dtype=float).reshape(len(angle), -1)
+    W = 1 / np.maximum(Y, 1)
+    C, L = np.meshgrid(centers, lengths, indexing="ij")
+    matched = phaseMatchingAngle(l, opening, model)
+    inside = matched + np.arcsin(
+        np.sin(angle - C[..., None]) / BBO.neeff(l, matched, model)
+    )
+    F = phaseMatching(inside, L[..., None], l, opening, model)  # (centers, lengths, N)
+
+    # Normal equations of weighted line fit in F, for every grid point and rate
+    Sw = W.sum(axis=0)
+    Sf = np.einsum("...n,nk->...k", F, W)
+    Sff = np.einsum("...n,nk->...k", F**2, W)
+    Sy = (W * Y).sum(axis=0)
+    Sfy = np.einsum("...n,nk->...k", F, W * Y)
+    det = Sff * Sw - Sf**2
+    det = np.where(det == 0, np.inf, det)
+    a = (Sw * Sfy - Sf * Sy) / det
+    b = (Sff * Sy - Sf * Sfy) / det
+
+    residual = Y - a[..., None, :] * F[..., None] - b[..., None, :]
+    chi2 = np.einsum("...nk,nk->...", residual**2, W)
+    i, j = np.unravel_index(np.argmin(chi2), chi2.shape)
+    return {
+        "center": C[i, j],
+        "length": L[i, j],
+        "amplitude": a[i, j],
+        "background": b[i, j],
+        "chi2": chi2,
+    }
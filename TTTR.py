@@ -0,0 +1,229 @@
+# HydraHarp T2 time-tagged records and synthetic SPDC streams for testing analysis
+
+# T2 record (HydraHarp V2 format, as read by HH_ReadFiFo in old/tttrmode.py):
+# bit 31 special | bits 30-25 channel | bits 24-0 timetag [ps]
+# special records: channel 0x3F overflow (timetag = number of overflows), channel 0 sync
+T2WRAPAROUND = 33554432
+T2CHANNEL_OVERFLOW = 0x3F
+
+from functools import lru_cache
+from statistics import NormalDist
+
+import numpy as np
+
+# Jitter is drawn from this many quantiles of normal distribution (up to 4.2 sigma),
+# bounded jitter lets chunks be ordered exactly
+JITTER_QUANTILES = 2**16
+
+
+def encodeT2(channels, times, overflows=0):
+    """Encodes sorted events as T2 records with overflow records in between
+
+    Args:
+        channels (array): input channel of every event, counted from 0
+        times (array): sorted times of events [ps]
+        overflows (int, optional): number of overflows already written. Defaults to 0.
+
+    Returns:
+        tuple: records (np.uint32 array) and number of overflows written so far
+    """
+    times = np.asarray(times, dtype=np.int64)
+    wraps = times >> 25
+    records = (np.asarray(channels, dtype=np.uint32) << 25) | (
+        times & (T2WRAPAROUND - 1)
+    ).astype(np.uint32)
+
+    steps = np.diff(wraps, prepend=overflows)
+    positions = np.flatnonzero(steps)
+    overflowRecords = (
+        np.uint32(1 << 31)
+        | np.uint32(T2CHANNEL_OVERFLOW << 25)
+        | steps[positions].astype(np.uint32)
+    )
+    if len(times):
+        overflows = int(wraps[-1])
+    return np.insert(records, positions, overflowRecords), overflows
+
+
+def decodeT2(records, overflows=0):
+    """Decodes T2 records, sync events get channel -1, markers are skipped
+
+    Args:
+        records (array): T2 records, e.g. np.fromfile(filename, dtype=np.uint32)
+        overflows (int, optional): number of overflows before the first record. Defaults to 0.
+
+    Returns:
+        tuple: channels, times [ps] and number of overflows after the last record
+    """
+    records = np.asarray(records, dtype=np.uint32)
+    special = records >> 31
+    channels = ((records >> 25) & 0x3F).astype(np.int64)
+    timetags = (records & (T2WRAPAROUND - 1)).astype(np.int64)
+
+    isOverflow = (special == 1) & (channels == T2CHANNEL_OVERFLOW)
+    wraps = overflows + np.cumsum(np.where(isOverflow, timetags, 0))
+    isEvent = special == 0
+    isSync = (special == 1) & (channels == 0)
+    keep = isEvent | isSync
+
+    times = wraps[keep] * T2WRAPAROUND + timetags[keep]
+    channels = np.where(isSync, -1, channels)[keep]
+    if len(wraps):
+        overflows = int(wraps[-1])
+    return channels, times, overflows
+
+
+def _applyDeadTime(times, deadTime, lastKept):
+    # Non-paralyzable dead time on sorted times of one channel.
+    # Kept events form a chain where each one is followed by the first event
+    # at least deadTime later. Events further than deadTime from the previous event
+    # are always kept, so only clusters of close events (with the event starting them)
+    # are walked, by pointer doubling in log2(longest chain in cluster) vectorized steps.
+    keep = np.ones(len(times), dtype=bool)
+    close = np.diff(times, prepend=lastKept) < deadTime
+    if not close.any():
+        return keep
+    sub = np.flatnonzero(close | np.append(close[1:], False))
+    times = times[sub]
+
+    # jump[i] = next kept event after i, len(sub) marks end. Events starting
+    # clusters are kept, chains are followed from all of them at once
+    jump = np.append(np.searchsorted(times, times + deadTime), len(sub))
+    first = np.searchsorted(times, lastKept + deadTime)
+    reached = np.append(~close[sub], True)
+    reached[first] = True
+    frontier = np.flatnonzero(reached[:-1])
+    while len(frontier):
+        following = jump[frontier]
+        following = following[~reached[following]]
+        reached[following] = True
+        frontier = np.concatenate((frontier, following))
+        if not len(following):
+            break
+        jump = jump[jump]
+    chain = np.flatnonzero(reached[:-1])
+
+    keep[sub] = False
+    keep[sub[chain]] = True
+    return keep
+
+
+@lru_cache
+def _normalQuantiles():
+    return np.array(
+        [
+            NormalDist().inv_cdf((i + 0.5) / JITTER_QUANTILES)
+            for i in range(JITTER_QUANTILES)
+        ]
+    )
+
+
+def generateSPDC(
+    duration,
+    pairRate=1.3e8,
+    efficiency=(0.0015, 0.0017),
+    darkRate=(100, 100),
+    jitter=50,
+    deadTime=22000,
+    delay=(0, 330),
+    channels=(2, 3),
+    chunkSize=1000000,
+    seed=None,
+):
+    """Generates T2 records of two detectors looking at Poissonian SPDC pairs,
+    defaults give about 195k and 221k singles/s and 330 coincidences/s like our logs.
+    Throughput depends on the machine, it is lower when detectors are saturated
+    (e.g. pairRate=1e10) and most time goes to dead time
+
+    Args:
+        duration (float): length of stream [s]
+        pairRate (float, optional): pairs emitted by crystal [1/s]. Defaults to 1.3e8.
+        efficiency (tuple, optional): probability of detecting photon of pair by each detector. Defaults to (0.0015, 0.0017).
+        darkRate (tuple, optional): dark counts of each detector [1/s]. Defaults to (100, 100).
+        jitter (float, optional): rms of gaussian timing jitter of each detection [ps]. Defaults to 50.
+        deadTime (int, optional): non-paralyzable dead time of detectors [ps]. Defaults to 22000.
+        delay (tuple, optional): cable delay of each detector [ps]. Defaults to (0, 330).
+        channels (tuple, optional): input channels of detectors, counted from 0. Defaults to (2, 3).
+        chunkSize (int, optional): number of emitted events simulated at once. Defaults to 1000000.
+        seed (int, optional): seed of random generator. Defaults to None.
+
+    Yields:
+        np.ndarray: T2 records (np.uint32), write them with records.tofile(file)
+    """
+    rng = np.random.default_rng(seed)
+    etaA, etaB = efficiency
+    # Rates of: pair detected by both, only by A, only by B, dark count of A, of B
+    rates = np.array(
+        [
+            pairRate * etaA * etaB,
+            pairRate * etaA * (1 - etaB),
+            pairRate * (1 - etaA) * etaB,
+            darkRate[0],
+            darkRate[1],
+        ]
+    )
+    thresholds = np.cumsum(rates / rates.sum())[:-1]
+    inA = np.array([True, True, False, True, False])
+    delay = np.asarray(delay, dtype=np.int64)
+    noise = np.rint(jitter * _normalQuantiles()).astype(np.int64)
+    maxNoise = int(np.abs(noise).max())
+
+    # Start late enough that jitter and delays never give negative times
+    t0 = float(maxNoise - min(delay.min(), 0))
+    end = t0 + duration * 1e12
+    overflows = 0
+    lastKept = [-deadTime, -deadTime]
+    # Detections are packed as 2 * time + detector, so one sort orders both
+    carry = np.empty(0, dtype=np.int64)
+
+    while True:
+        # Merged Poisson process of everything detected, sorted by construction
+        emitted = t0 + np.cumsum(
+            rng.standard_exponential(chunkSize) / rates.sum() * 1e12
+        )
+        t0 = emitted[-1]
+        finished = t0 >= end
+        emitted = emitted[emitted < end].astype(np.int64)
+        u = rng.random(len(emitted))
+        kind = (u >= thresholds[0]).astype(np.int8)
+        for threshold in thresholds[1:]:
+            kind += u >= threshold
+
+        # One detection of every emitted event in order of emission,
+        # second detectors of pairs are rare and appended at the end
+        detector = 1 - inA[kind]
+        packed = np.concatenate(
+            (
+                2 * (emitted + delay[detector]) + detector,
+                2 * (emitted[kind == 0] + delay[1]) + 1,
+            )
+        )
+        if jitter > 0:
+            packed += 2 * noise[rng.integers(0, JITTER_QUANTILES, len(packed))]
+
+        # Jitter only swaps close neighbours, sorting nearly sorted array is fast
+        packed = np.sort(np.concatenate((carry, packed)), kind="stable")
+        # Later events may still be overtaken by events of the next chunk
+        if finished:
+            ready = len(packed)
+        else:
+            ready = np.searchsorted(packed, 2 * (int(t0) + delay.min() - maxNoise))
+        carry = packed[ready:]
+        packed = packed[:ready]
+
+        detector = packed & 1
+        times = packed >> 1
+        keep = np.ones(len(packed), dtype=bool)
+        for i in (0, 1):
+            mine = np.flatnonzero(detector == i)
+            alive = _applyDeadTime(times[mine], deadTime, lastKept[i])
+            keep[mine[~alive]] = False
+            if alive.any():
+                lastKept[i] = times[mine[alive]][-1]
+
+        records, overflows = encodeT2(
+            np.asarray(channels)[detector[keep]], times[keep], overflows
+        )
+        yield records
+        if finished:
+            return
@@ -0,0 +1,353 @@
+# Histogram types for data measured by HydraHarp in histogram mode
+
+import numpy as np
+
+
+def _levelFor(start, stop, pixels, maxLevel):
+    # Finest level with at most pixels bins between start and stop
+    level = int(np.ceil(np.log2(max(stop - start, 1) / max(pixels, 1))))
+    return min(max(level, 0), maxLevel)
+
+
+def _viewRange(start, stop, level, length):
+    # Bins of level covering start to stop, ranges outside [0, length) give no bins
+    lo = min(max(start, 0), length) >> level
+    hi = max(lo, -(-min(max(stop, 0), length) // 2**level))
+    return lo, hi
+
+
+class SparseHistogram:
+    """Histogram storing only nonzero bins as sorted indices and values
+
+    Args:
+        indices (array): positions of nonzero bins
+        values (array): counts in these bins
+        length (int): number of bins of the whole histogram
+    """
+
+    def __init__(self, indices, values, length):
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.int64)
+        self.length = int(length)
+
+    @classmethod
+    def fromDense(cls, counts):
+        """Makes sparse histogram from array of counts
+
+        Args:
+            counts (array): counts in every bin, e.g. HH.counts[i]
+
+        Returns:
+            SparseHistogram: histogram
+        """
+        counts = np.asarray(counts)
+        indices = np.flatnonzero(counts)
+        return cls(indices, counts[indices], len(counts))
+
+    @classmethod
+    def _fromUnsorted(cls, indices, values, length):
+        # Merges repeated indices and drops empty bins
+        order = np.argsort(indices, kind="stable")
+        indices, values = indices[order], values[order]
+        starts = np.flatnonzero(np.diff(indices, prepend=-1))
+        indices = indices[starts]
+        values = np.add.reduceat(values, starts) if len(starts) else values
+        nonzero = values != 0
+        return cls(indices[nonzero], values[nonzero], length)
+
+    def toDense(self):
+        """Returns counts in every bin
+
+        Returns:
+            np.ndarray: counts
+        """
+        out = np.zeros(self.length, dtype=np.int64)
+        out[self.indices] = self.values
+        return out
+
+    def sum(self):
+        """Returns integral count
+
+        Returns:
+            int: sum of all bins
+        """
+        return int(self.values.sum())
+
+    def rebin(self, factor):
+        """Joins every factor neighbouring bins into one
+
+        Args:
+            factor (int): number of bins to join, like 2**binning in HH.setEverything
+
+        Returns:
+            SparseHistogram: histogram with ceil(length / factor) bins
+        """
+        if factor < 1:
+            raise ValueError("Rebinning factor has to be at least 1")
+        indices = self.indices // factor
+        starts = np.flatnonzero(np.diff(indices, prepend=-1))
+        values = np.add.reduceat(self.values, starts) if len(starts) else self.values
+        nonzero = values != 0
+        return SparseHistogram(
+            indices[starts][nonzero], values[nonzero], -(-self.length // factor)
+        )
+
+    def window(self, start, stop):
+        """Returns bins from start to stop, like dense[start:stop]
+
+        Args:
+            start (int): first bin
+            stop (int): bin after the last one
+
+        Returns:
+            SparseHistogram: histogram with stop - start bins
+        """
+        start, stop, _ = slice(start, stop).indices(self.length)
+        stop = max(start, stop)
+        lo, hi = np.searchsorted(self.indices, [start, stop])
+        return SparseHistogram(
+            self.indices[lo:hi] - start, self.values[lo:hi], stop - start
+        )
+
+    def levelFor(self, start, stop, pixels):
+        """Returns the finest level with at most pixels bins between start and stop,
+        same as HistogramPyramid.levelFor
+
+        Args:
+            start (int): first bin
+            stop (int): bin after the last one
+            pixels (int): width of view in pixels
+
+        Returns:
+            int: level
+        """
+        return _levelFor(
+            start, stop, pixels, int(np.ceil(np.log2(max(self.length, 1))))
+        )
+
+    def view(self, start, stop, pixels):
+        """Returns the same as HistogramPyramid.view, computed only from bins in view,
+        so no pyramid has to be built for histogram shown once (e.g. live view)
+
+        Args:
+            start (int): first bin
+            stop (int): bin after the last one
+            pixels (int): width of view in pixels
+
+        Returns:
+            tuple: first original bin of every bin, mins, maxs and sums
+        """
+        level = self.levelFor(start, stop, pixels)
+        lo, hi = _viewRange(start, stop, level, self.length)
+        part = self.window(lo << level, hi << level)
+        groups = part.indices >> level
+        starts = np.flatnonzero(np.diff(groups, prepend=-1))
+        groups = groups[starts]
+
+        mins, maxs, sums = (np.zeros(hi - lo, dtype=np.int64) for _ in range(3))
+        if len(starts):
+            sums[groups] = np.add.reduceat(part.values, starts)
+            maxs[groups] = np.maximum.reduceat(part.values, starts)
+            mins[groups] = np.minimum.reduceat(part.values, starts)
+            # Joined bins with some empty bins have 0 among their values
+            size = np.minimum(2**level, self.length - ((lo + groups) << level))
+            partial = groups[np.diff(starts, append=len(part.indices)) < size]
+            maxs[partial] = np.maximum(maxs[partial], 0)
+            mins[partial] = np.minimum(mins[partial], 0)
+        return np.arange(lo, hi) << level, mins, maxs, sums
+
+    def __getitem__(self, key):
+        if isinstance(key, slice) and key.step in (None, 1):
+            return self.window(key.start, key.stop)
+        return self.toDense()[key]
+
+    def __len__(self):
+        return self.length
+
+    def __add__(self, other):
+        if self.length != other.length:
+            raise ValueError("Histograms have different lengths")
+        return SparseHistogram._fromUnsorted(
+            np.concatenate((self.indices, other.indices)),
+            np.concatenate((self.values, other.values)),
+            self.length,
+        )
+
+    def __neg__(self):
+        return SparseHistogram(self.indices, -self.values, self.length)
+
+    def __sub__(self, other):
+        return self + -other
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, SparseHistogram)
+            and self.length == other.length
+            and np.array_equal(self.indices, other.indices)
+            and np.array_equal(self.values, other.values)
+        )
+
+    def __repr__(self):
+        return "SparseHistogram(length=%d, nonzero=%d, sum=%d)" % (
+            self.length,
+            len(self.indices),
+            self.sum(),
+        )
+
+
+def saveHistograms(filename, histograms):
+    """Saves sparse histograms of all channels to compressed .npz file
+
+    Args:
+        filename (str): path to file, .npz is appended if missing
+        histograms (list): SparseHistogram of every channel
+    """
+    arrays = {}
+    for i, hist in enumerate(histograms):
+        arrays["indices%d" % i] = hist.indices.astype(np.uint32)
+        arrays["values%d" % i] = hist.values
+    np.savez_compressed(
+        filename, lengths=np.array([hist.length for hist in histograms]), **arrays
+    )
+
+
+def loadHistograms(filename):
+    """Loads histograms saved by saveHistograms
+
+    Args:
+        filename (str): path to .npz file
+
+    Returns:
+        list: SparseHistogram of every channel
+    """
+    with np.load(filename) as f:
+        return [
+            SparseHistogram(f["indices%d" % i], f["values%d" % i], length)
+            for i, length in enumerate(f["lengths"])
+        ]
+
+
+class HistogramPyramid:
+    """Precomputed min, max and sum of histogram over bins joined by 2**level,
+    like increasing binning code of HH.setEverything by level, but done in software
+
+    Args:
+        counts (array or SparseHistogram): counts in every bin
+    """
+
+    def __init__(self, counts):
+        if isinstance(counts, SparseHistogram):
+            counts = counts.toDense()
+        counts = np.asarray(counts)
+        self.length = len(counts)
+        self.mins = [counts]
+        self.maxs = [counts]
+        self.sums = [counts.astype(np.int64)]
+        while len(self.sums[-1]) > 1:
+            mins, maxs, sums = self.mins[-1], self.maxs[-1], self.sums[-1]
+            if len(sums) % 2:
+                mins = np.append(mins, mins[-1])
+                maxs = np.append(maxs, maxs[-1])
+                sums = np.append(sums, 0)
+            self.mins.append(np.minimum(mins[0::2], mins[1::2]))
+            self.maxs.append(np.maximum(maxs[0::2], maxs[1::2]))
+            self.sums.append(sums[0::2] + sums[1::2])
+
+    def levelFor(self, start, stop, pixels):
+        """Returns the finest level with at most pixels bins between start and stop
+
+        Args:
+            start (int): first bin
+            stop (int): bin after the last one
+            pixels (int): width of view in pixels
+
+        Returns:
+            int: level
+        """
+        return _levelFor(start, stop, pixels, len(self.sums) - 1)
+
+    def view(self, start, stop, pixels):
+        """Returns bins of the level matching pixel width between start and stop
+
+        Args:
+            start (int): first bin
+            stop (int): bin after the last one
+            pixels (int): width of view in pixels
+
+        Returns:
+            tuple: first original bin of every bin, mins, maxs and sums
+        """
+        level = self.levelFor(start, stop, pixels)
+        lo, hi = _viewRange(start, stop, level, self.length)
+        return (
+            np.arange(lo, hi) * 2**level,
+            self.mins[level][lo:hi],
+            self.maxs[level][lo:hi],
+            self.sums[level][lo:hi],
+        )
+
+
+def lineData(histogram, ax, resolution, mode="envelope", start=None, stop=None):
+    """Returns line showing histogram between x limits of ax
+    with only as many points as ax is wide in pixels
+
+    Args:
+        histogram (HistogramPyramid or SparseHistogram): histogram
+        ax (Axes): where the line is drawn
+        resolution (int): step in ps
+        mode (str, optional): "envelope" or "sum", see plotPyramid. Defaults to "envelope".
+        start (int, optional): first bin. Defaults to left x limit of ax.
+        stop (int, optional): bin after the last one. Defaults to right x limit of ax.
+
+    Returns:
+        tuple: time [ns] and counts
+    """
+    if start is None:
+        x0, x1 = ax.get_xlim()
+        start = int(np.floor(x0 * 1000 / resolution))
+        stop = int(np.ceil(x1 * 1000 / resolution)) + 1
+    pixels = int(ax.get_window_extent().width)
+    bins, mins, maxs, sums = histogram.view(start, stop, pixels)
+    T = bins / 1000 * resolution
+    if mode == "envelope":
+        return np.repeat(T, 2), np.column_stack((mins, maxs)).ravel()
+    elif mode == "sum":
+        return T, sums / 2 ** histogram.levelFor(start, stop, pixels)
+    raise ValueError
+
+
+def plotPyramid(ax, pyramid, resolution, mode="envelope", **kwargs):
+    """Plots histogram with only as many points as ax is wide in pixels,
+    picked again from pyramid whenever x limits change (e.g. after plt.xlim(14, 20))
+
+    Args:
+        ax (Axes): where to plot
+        pyramid (HistogramPyramid or SparseHistogram): histogram
+        resolution (int): step in ps
+        mode (str, optional): "envelope" draws min and max of joined bins, so no peak is lost,
+            "sum" draws mean counts per original bin of joined bins, so y scale
+            does not change with zoom. Defaults to "envelope".
+        **kwargs: passed to ax.plot
+
+    Returns:
+        Line2D: plotted line
+    """
+    if mode == "sum":
+        kwargs.setdefault("drawstyle", "steps-post")
+    elif mode != "envelope":
+        raise ValueError
+    (line,) = ax.plot([], [], **kwargs)
+
+    def update(ax, start=None, stop=None):
+        line.set_data(*lineData(pyramid, ax, resolution, mode, start, stop))
+        if ax.get_autoscaley_on():
+            # Finer levels show more fluctuations
+            ax.relim()
+            ax.autoscale_view(scalex=False)
+
+    update(ax, 0, pyramid.length)
+    ax.relim()
+    ax.autoscale_view()
+    update(ax)
+    ax.callbacks.connect("xlim_changed", update)
+    return line
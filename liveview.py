@@ -0,0 +1,254 @@
+# Live view of HydraHarp histograms, acquisition runs in its own thread
+# and never waits for drawing, renderer redraws only the changed artists
+
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+import HH
+from histogram import lineData
+
+Frame = namedtuple("Frame", "index time tacq histLen histograms log")
+
+
+class LiveMonitor:
+    """Measures histograms in a loop and keeps only the newest frames,
+    older frames are dropped when the renderer does not keep up
+
+    Args:
+        tacq (int): acquisition time of one frame [ms]
+        maxFrames (int, optional): length of frame queue. Defaults to 2.
+    """
+
+    def __init__(self, tacq, maxFrames=2):
+        self.tacq = tacq
+        self.frames = deque(maxlen=maxFrames)
+        self.condition = threading.Condition()
+        self.running = threading.Event()
+        self.thread = None
+        self.acquired = 0
+        self.dropped = 0
+        self.t0 = None
+        self.error = None
+
+    def _acquire(self):
+        try:
+            while self.running.is_set():
+                self._measure()
+        except Exception as e:
+            # Kept for run, exceptions of threads are otherwise only printed
+            self.error = e
+            raise
+
+    def _measure(self):
+        log, histLen, numChannels, histograms = HH.measureAllInputs(
+            self.tacq, sparse=True
+        )
+        self.acquired += 1
+        frame = Frame(
+            self.acquired,
+            time.time() - self.t0,
+            self.tacq,
+            histLen,
+            histograms,
+            log,
+        )
+        with self.condition:
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped += 1
+            self.frames.append(frame)
+            self.condition.notify()
+
+    def start(self):
+        """Starts acquisition thread"""
+        self.t0 = time.time()
+        self.error = None
+        self.running.set()
+        self.thread = threading.Thread(target=self._acquire, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops acquisition after current frame is measured"""
+        self.running.clear()
+        if self.thread is not None:
+            self.thread.join()
+
+    def get(self, timeout=None):
+        """Returns the oldest frame in queue, waits for it if queue is empty
+
+        Args:
+            timeout (float, optional): [s]. Defaults to None.
+
+        Returns:
+            Frame: frame or None after timeout
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.frames, timeout):
+                return None
+            return self.frames.popleft()
+
+    def dutyCycle(self):
+        """Returns fraction of time spent on acquisition
+
+        Returns:
+            float: duty cycle
+        """
+        if self.t0 is None:
+            return 0
+        return self.acquired * self.tacq / 1000 / max(time.time() - self.t0, 1e-9)
+
+
+class LiveRenderer:
+    """Draws frames with persistent artists, after the first draw only lines
+    and text are redrawn over the saved background (blitting)
+
+    Args:
+        ax (Axes): where to draw
+        resolution (int): step in ps
+        channels (tuple, optional): channels to draw, counted from 0. Defaults to (2, 3).
+        colors (tuple, optional): color of every channel. Defaults to ("black", "#9467bd").
+        stopSearch (float, optional): end of peak search [ns]. Defaults to 30.
+        hdisplay (DisplayHandle, optional): updated instead of blitting on canvases
+            which cannot blit, e.g. inline backend. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        ax,
+        resolution,
+        channels=(2, 3),
+        colors=("black", "#9467bd"),
+        stopSearch=30,
+        hdisplay=None,
+    ):
+        self.ax = ax
+        self.fig = ax.figure
+        self.canvas = self.fig.canvas
+        self.resolution = resolution
+        self.channels = channels
+        self.stopSearch = stopSearch
+        self.hdisplay = hdisplay
+        self.blit = hdisplay is None and self.canvas.supports_blit
+        self.deltaT = []
+
+        self.lines = [
+            ax.plot(
+                [], [], color=color, label="Channel " + str(ch + 1), animated=self.blit
+            )[0]
+            for ch, color in zip(channels, colors)
+        ]
+        self.text = ax.text(
+            0.01,
+            0.99,
+            "",
+            transform=ax.transAxes,
+            va="top",
+            fontsize="small",
+            animated=self.blit,
+        )
+        ax.set_xlabel("Time / ns")
+        ax.set_ylabel("Counts")
+        ax.legend(loc="upper right")
+
+        self.background = None
+        self.canvas.mpl_connect("draw_event", self._onDraw)
+
+    def _onDraw(self, event):
+        # Background changes after full redraw, e.g. resize, zoom or new ylim
+        if self.blit:
+            self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+            self._drawArtists()
+
+    def _drawArtists(self):
+        for artist in self.lines + [self.text]:
+            self.fig.draw_artist(artist)
+
+    def draw(self, frame, monitor=None):
+        """Updates lines and text with frame
+
+        Args:
+            frame (Frame): frame from LiveMonitor
+            monitor (LiveMonitor, optional): to show duty cycle and dropped frames. Defaults to None.
+        """
+        searchEnd = int(self.stopSearch * 1000 / self.resolution)
+
+        peaks = []
+        top = 0
+        for line, ch in zip(self.lines, self.channels):
+            hist = frame.histograms[ch]
+            T, counts = lineData(hist, self.ax, self.resolution)
+            line.set_data(T, counts)
+            top = max(top, counts.max(initial=0))
+            peaks.append(
+                np.argmax(hist.window(0, searchEnd).toDense()) / 1e3 * self.resolution
+            )
+        self.deltaT.append(round(float(peaks[0] - peaks[1]), 3))
+
+        text = (
+            "t=%.1f s, N=%d, acq time=%d ms, resolution=%d ps\n"
+            % (frame.time, frame.index, frame.tacq, self.resolution)
+            + "  ".join(
+                "ChRate[%d]=%d/s"
+                % (ch + 1, frame.histograms[ch].sum() * 1000 / frame.tacq)
+                for ch in self.channels
+            )
+            + "\n$\\Delta t$=%.3f ns, " % self.deltaT[-1]
+            + ", ".join(
+                "$t_{ch%dmax}$=%.3f ns" % (ch + 1, peak)
+                for ch, peak in zip(self.channels, peaks)
+            )
+        )
+        if monitor is not None:
+            text += "\nduty cycle=%.1f %%, dropped=%d" % (
+                100 * monitor.dutyCycle(),
+                monitor.dropped,
+            )
+        self.text.set_text(text)
+
+        if top + 1 > self.ax.get_ylim()[1]:
+            self.ax.set_ylim(0, (top + 1) * 1.2)
+            self.background = None
+
+        if self.hdisplay is not None:
+            self.hdisplay.update(self.fig)
+        elif not self.blit or self.background is None:
+            # Full redraw saves new background, needed only when ylim grows
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self.background)
+            self._drawArtists()
+            self.canvas.blit(self.fig.bbox)
+        self.canvas.flush_events()
+
+
+def run(monitor, renderer, frames=np.inf):
+    """Renders frames of monitor until KeyboardInterrupt or given number of frames,
+    stops when acquisition fails and raises its exception
+
+    Args:
+        monitor (LiveMonitor): acquisition
+        renderer (LiveRenderer): drawing
+        frames (int, optional): number of frames to draw. Defaults to np.inf.
+
+    Returns:
+        list: delays between peaks of channels in every drawn frame [ns]
+    """
+    monitor.start()
+    drawn = 0
+    try:
+        while drawn < frames:
+            frame = monitor.get(timeout=1)
+            if frame is not None:
+                renderer.draw(frame, monitor)
+                drawn += 1
+            elif not monitor.thread.is_alive():
+                if monitor.error is not None:
+                    raise monitor.error
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        monitor.stop()
+    return renderer.deltaT